@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+#
+#  Copyright 2019, Jack Poulson, Sandra Poulson
+#  All rights reserved.
+#
+#  This file is part of mice_notes and is under the BSD 3-Clause License,
+#  which can be found in the LICENSE file in the root directory, or at
+#  http://opensource.org/licenses/BSD-2-Clause
+#
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+# Bump whenever the layout of a cached product changes so that stale entries
+# written by an older version are never returned.
+CACHE_VERSION = 1
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.mice_notes_cache')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _canonical(value):
+  """Converts a value into a JSON-serializable form with a stable ordering."""
+  if isinstance(value, dict):
+    return [[str(key), _canonical(value[key])] for key in sorted(value, key=str)]
+  if isinstance(value, (list, tuple)):
+    return [_canonical(item) for item in value]
+  if hasattr(value, 'tolist'):
+    return _canonical(value.tolist())
+  if isinstance(value, float):
+    return repr(value)
+  return value
+
+
+def content_hash(actions, ethogram=None, **params):
+  """Returns a hex digest identifying a session and how it is being analyzed.
+
+  Args:
+    actions: The dictionary from keystrokes to event interval lists.
+    ethogram: Optional dictionary (e.g., of labels or colors) which influences
+      the derived product.
+    params: Any additional parameters of the derived product.
+
+  Returns:
+    The SHA-256 hex digest of the canonicalized inputs.
+  """
+  payload = {
+    'version': CACHE_VERSION,
+    'actions': actions,
+    'ethogram': ethogram,
+    'params': params,
+  }
+  encoded = json.dumps(_canonical(payload), separators=(',', ':'))
+  return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class DerivedCache(object):
+  """A content-addressed, size-bounded on-disk cache of derived products.
+
+  Entries are keyed by the hash of the session data, the ethogram and the
+  parameters of the product, so a change to any of them simply misses the
+  cache. Once the total size of the entries exceeds 'max_bytes', the least
+  recently used entries are evicted; products which are larger than
+  'max_bytes' on their own are never stored.
+  """
+
+  def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+    # The running total of the entry sizes, so that writes only need to scan
+    # the directory once the bound is crossed.
+    self._size = self.size()
+
+  def _path(self, product, key):
+    return os.path.join(self.directory, '{}-{}.pkl'.format(product, key))
+
+  def get(self, product, key):
+    """Returns a pair (hit, value) for the given product and content key."""
+    path = self._path(product, key)
+    try:
+      with open(path, 'rb') as cache_file:
+        value = pickle.load(cache_file)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+      return False, None
+
+    # Touch the entry so that it becomes the most recently used.
+    try:
+      os.utime(path, None)
+    except OSError:
+      pass
+    return True, value
+
+  def put(self, product, key, value):
+    """Stores a derived product and evicts entries beyond the size bound.
+
+    Returns:
+      Whether the product was stored, which is not the case if it alone
+      exceeds 'max_bytes'.
+    """
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) > self.max_bytes:
+      return False
+
+    path = self._path(product, key)
+    try:
+      old_size = os.stat(path).st_size
+    except OSError:
+      old_size = 0
+
+    handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    try:
+      with os.fdopen(handle, 'wb') as temp_file:
+        temp_file.write(data)
+      os.replace(temp_path, path)
+    except:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+      raise
+
+    self._size += len(data) - old_size
+    if self._size > self.max_bytes:
+      self.evict(keep=path)
+    return True
+
+  def memoize(self, product, function, actions, ethogram=None, **params):
+    """Returns function(actions, **params), reusing a cached result if present.
+
+    Args:
+      product: A short name for the derived product, e.g., 'summary'.
+      function: The routine which computes the product.
+      actions: The dictionary from keystrokes to event interval lists.
+      ethogram: Optional dictionary which influences the product.
+      params: The keyword arguments of 'function'.
+
+    Returns:
+      The (possibly cached) derived product.
+    """
+    key = content_hash(actions, ethogram, product=product, **params)
+    hit, value = self.get(product, key)
+    if not hit:
+      value = function(actions, **params)
+      self.put(product, key, value)
+    return value
+
+  def entries(self):
+    """Returns a list of (modification time, size, path) of cached entries."""
+    entries = []
+    for name in os.listdir(self.directory):
+      if not name.endswith('.pkl'):
+        continue
+      path = os.path.join(self.directory, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+  def size(self):
+    """Returns the total number of bytes held by the cache."""
+    return sum(size for _, size, _ in self.entries())
+
+  def evict(self, keep=None):
+    """Removes least recently used entries until within the size bound.
+
+    Args:
+      keep: Optional path of an entry which must not be evicted, e.g., the
+        one which was just written.
+    """
+    entries = sorted(self.entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+      if total <= self.max_bytes:
+        break
+      if path == keep:
+        continue
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      total -= size
+    self._size = total
+
+  def clear(self):
+    """Removes every cached entry."""
+    for _, _, path in self.entries():
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+    self._size = 0
@@ -15,6 +15,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import time
+from recorder_profile import SET_RAW, READ, RESTORE, DISPATCH, PRINT, APPEND
 
 labels = defaultdict()
 labels['a'] = 'Allogrooming'
@@ -76,101 +77,178 @@ def ready_stdin():
   fcntl.fcntl(fd, fcntl.F_SETFL, flags_save & ~os.O_NONBLOCK)
   return fd, attrs, attrs_save, flags_save
 
-def read_key(fd,attrs,attrs_save,flags_save):
+def read_key(fd,attrs,attrs_save,flags_save,profiler=None):
   # TODO: Figure out how to avoid setting and resetting tc on each read
   termios.tcsetattr(fd, termios.TCSANOW, attrs)
+  if profiler is not None:
+    profiler.mark(SET_RAW)
   try:
     ret = sys.stdin.read(1)
   except KeyboardInterrupt:
     ret = 0
+  if profiler is not None:
+    profiler.mark(READ)
   termios.tcsetattr(fd, termios.TCSAFLUSH, attrs_save)
+  if profiler is not None:
+    profiler.mark(RESTORE)
   return ret
 
 def restore_stdin(fd,attrs,attrs_save,flags_save):
   termios.tcsetattr(fd, termios.TCSAFLUSH, attrs_save)
   fcntl.fcntl(fd, fcntl.F_SETFL, flags_save)
 
-def start(print_progress = True):
+def summarize_actions(actions, pie_order=pie_order, cache=None):
+  """Totals the time spent in each action.
+
+  Args:
+    actions: The dictionary from keystrokes to event interval lists.
+    pie_order: The order in which the actions should be summarized.
+    cache: Optional 'derived_cache.DerivedCache' for memoizing the summaries
+      of archived sessions which are repeatedly re-analyzed.
+
+  Returns:
+    List of (keystroke, total seconds) pairs for each recorded action.
   """
-  This is for recording a small number of events for two mice in a cage via
-  the following keypresses:
-  
-  'a': Allogrooming (grooming the other mouse)
-  
-  'b': Burrowing (rummaging under bedding or other mouse)
-  
-  'd': Digging near mouse
+  if cache is not None:
+    return cache.memoize('summary', summarize_actions, actions,
+        pie_order=pie_order)
+
+  summary = []
+  for key in pie_order:
+    if key in actions:
+      total = 0
+      for beg, end in actions[key]:
+        total = total + (end - beg)
+      summary.append((key, total))
+  return summary
+
+def bin_intervals(starts, ends, groups, num_groups, edges):
+  """Sums the overlap of intervals with consecutive bins within each group.
+
+  Only the bins spanned by an interval can overlap it, so rather than forming
+  the full (interval x bin) overlap matrix, each interval is expanded into
+  the bins it touches.
 
-  'f': Fluffing own nest
-  
-  'n': Near (side-by-side)
-  
-  'r': Rearing (forepaws in air or against wall)
-  
-  's': Sniffing other
-  
-  'o': Other (blank state).
+  Args:
+    starts: The array of interval start times.
+    ends: The array of interval end times.
+    groups: The integer array of the group index of each interval.
+    num_groups: The number of groups.
+    edges: The monotonically increasing bin edges.
 
-  'm': Pulling hair or aggressive behavior
+  Returns:
+    Array of shape (num_groups, len(edges) - 1) of the time spent within each
+    bin by the intervals of each group.
+  """
+  starts = np.asarray(starts, dtype=float)
+  ends = np.asarray(ends, dtype=float)
+  groups = np.asarray(groups, dtype=np.intp)
+  edges = np.asarray(edges, dtype=float)
+  num_bins = len(edges) - 1
+
+  first_bin = np.clip(np.searchsorted(edges, starts, side='right') - 1,
+                      0, num_bins - 1)
+  last_bin = np.clip(np.searchsorted(edges, ends, side='left') - 1,
+                     first_bin, num_bins - 1)
+  spans = last_bin - first_bin + 1
+  interval = np.repeat(np.arange(len(spans)), spans)
+  offsets = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+  bin_index = first_bin[interval] + offsets
+
+  overlap = (np.minimum(ends[interval], edges[bin_index + 1]) -
+             np.maximum(starts[interval], edges[bin_index]))
+  binned = np.zeros((num_groups, num_bins))
+  np.add.at(binned, (groups[interval], bin_index), np.clip(overlap, 0, None))
+  return binned
+
+def bin_actions(actions, bin_width=60., duration=None):
+  """Computes the time spent in each action within consecutive time bins.
 
-  'f': Paw flicking
+  Args:
+    actions: The dictionary from keystrokes to event interval lists.
+    bin_width: The width of each time bin in seconds.
+    duration: The length of the session; defaults to the last interval end.
 
-  'g': Paw guarding
+  Returns:
+    Pair of the bin edges and a dictionary from keystrokes to the number of
+    seconds spent in the action within each bin.
+  """
+  keys = list(actions)
+  segments = [np.asarray(actions[key], dtype=float).reshape(-1, 2)
+              for key in keys]
+  groups = [np.full(len(segment), index, dtype=np.intp)
+            for index, segment in enumerate(segments)]
+  segments = np.concatenate(segments + [np.zeros((0, 2))])
+  groups = np.concatenate(groups + [np.zeros(0, dtype=np.intp)])
+
+  if duration is None:
+    duration = segments[:, 1].max() if len(segments) else 0.
+  num_bins = max(int(np.ceil(duration / bin_width)), 1)
+  edges = bin_width * np.arange(num_bins + 1, dtype=float)
+
+  binned = bin_intervals(segments[:, 0], segments[:, 1], groups, len(keys),
+                         edges)
+  time_course = {}
+  for index, key in enumerate(keys):
+    time_course[key] = binned[index]
+  return edges, time_course
+
+def chunk_actions(actions, granularity=0.1):
+  """Emits repeated event instances every 'granularity' seconds per interval.
 
-  'l': Paw licking
+  Args:
+    actions: The dictionary from keystrokes to event interval lists.
+    granularity: The time span granularity for emitting repeated events.
 
-  Additionally, 'q' quits and 'p' pauses/unpauses the recording process.
+  Returns:
+    Dictionary from keystrokes to lists of event instances.
+  """
+  chunked_actions = {}
+  for action in actions:
+    chunked_actions[action] = []
+    for interval in actions[action]:
+      chunked_actions[action].extend(
+          np.arange(interval[0], interval[1], granularity).tolist())
+  return chunked_actions
+
+def record(labels=labels, initial_key='o', default_key='o',
+    print_progress=True, profiler=None):
+  """Records keypress-delimited action segments until 'q' is pressed.
+
+  This is the recording engine shared by 'start' and 'twochamber.start'.
+
+  Args:
+    labels: The dictionary from recognized keystrokes to action labels.
+    initial_key: The keystroke of the state the recording begins in.
+    default_key: The keystroke substituted for unrecognized keys.
+    print_progress: Whether to print each recognized keypress.
+    profiler: Optional 'recorder_profile.RecorderProfiler' which times each
+      stage of the loop and summarizes the timings upon quitting.
+
+  Returns:
+    Dictionary from keystrokes to event interval lists.
   """
   time_delta = time.time()
   paused = False
 
-  # Initialize in the 'other' state
   action_start = 0
-  action_type = 'o'
+  action_type = initial_key
 
   # Ready stdin for reading a single key
   stdin_state = ready_stdin()
 
   actions = defaultdict(list)
   while True:
-    key = read_key(*stdin_state)
+    if profiler is not None:
+      profiler.begin()
+    key = read_key(*stdin_state, profiler=profiler)
     curr_time = time.time() - time_delta
 
     if key == 'q':
-      # Finish the current action
+      # Finish the current action and exit the while loop
       actions[action_type].append((action_start, curr_time))
-
-      # Summarize all of the actions
-      totals = ()
-      used_labels = ()
-      used_colors = ()
-      for key in pie_order:
-        if key in actions:
-          segments = actions[key]
-
-          total = 0
-          for beg, end in segments:
-            total = total + (end - beg)
-          totals = totals + (total,)
-
-          print('')
-          print('{} ({} seconds)'.format(labels[key], total))
-          print(segments)
-
-          used_labels = used_labels + (labels[key],)
-          used_colors = used_colors + (colors[key],)
-
-      # Attempt to create a pie chart using pyplot
-      try:
-        import matplotlib.pyplot as plt
-        plt.pie(totals, labels=used_labels, colors=used_colors, \
-          autopct='%1.1f%%', shadow=True)
-        plt.axis('equal')
-        plt.show()
-      except:
-        print('WARNING: Could not import pyplot')
-
-      # Exit the while loop
+      if profiler is not None:
+        profiler.mark(APPEND)
       break
 
     elif key == ' ':
@@ -186,24 +264,107 @@ def start(print_progress = True):
 
     elif not paused:
       if key not in labels:
-        print('WARNING: Unrecognized key, "{}"; defaulting to "Other"'.format(key))
-        key = 'o'
+        print('WARNING: Unrecognized key, "{}"; defaulting to "{}"'.format(
+            key, labels[default_key]))
+        key = default_key
+      if profiler is not None:
+        profiler.mark(DISPATCH)
 
       if print_progress:
         print('{} at {} seconds'.format(labels[key], curr_time))
+        if profiler is not None:
+          profiler.mark(PRINT)
 
       if action_type != key:
         actions[action_type].append((action_start, curr_time))
         action_type = key
         action_start = curr_time
+        if profiler is not None:
+          profiler.mark(APPEND)
 
   # Put stdin back to normal before exiting
   restore_stdin(*stdin_state)
 
+  if profiler is not None:
+    profiler.finish()
+
+  return actions
+
+def report(actions, labels=labels, colors=colors, pie_order=pie_order):
+  """Prints the total time spent in each action and draws a pie chart.
+
+  Args:
+    actions: The dictionary from keystrokes to event interval lists.
+    labels: The dictionary from keystrokes to action labels.
+    colors: The dictionary from keystrokes to hex colors.
+    pie_order: The order in which the actions should be summarized.
+  """
+  summary = summarize_actions(actions, pie_order=pie_order)
+  totals = ()
+  used_labels = ()
+  used_colors = ()
+  for key, total in summary:
+    totals = totals + (total,)
+
+    print('')
+    print('{} ({} seconds)'.format(labels[key], total))
+    print(actions[key])
+
+    used_labels = used_labels + (labels[key],)
+    used_colors = used_colors + (colors[key],)
+
+  # Attempt to create a pie chart using pyplot
+  try:
+    import matplotlib.pyplot as plt
+    plt.pie(totals, labels=used_labels, colors=used_colors, \
+      autopct='%1.1f%%', shadow=True)
+    plt.axis('equal')
+    plt.show()
+  except:
+    print('WARNING: Could not import pyplot')
+
+def start(print_progress = True, profiler = None):
+  """
+  This is for recording a small number of events for two mice in a cage via
+  the following keypresses:
+  
+  'a': Allogrooming (grooming the other mouse)
+  
+  'b': Burrowing (rummaging under bedding or other mouse)
+  
+  'd': Digging near mouse
+
+  'f': Fluffing own nest
+  
+  'n': Near (side-by-side)
+  
+  'r': Rearing (forepaws in air or against wall)
+  
+  's': Sniffing other
+  
+  'o': Other (blank state).
+
+  'm': Pulling hair or aggressive behavior
+
+  'f': Paw flicking
+
+  'g': Paw guarding
+
+  'l': Paw licking
+
+  Additionally, 'q' quits and 'p' pauses/unpauses the recording process.
+
+  A 'recorder_profile.RecorderProfiler' passed as 'profiler' times each
+  keystroke through the recording loop.
+  """
+  # Initialize in the 'other' state
+  actions = record(labels, initial_key='o', default_key='o',
+      print_progress=print_progress, profiler=profiler)
+  report(actions, labels=labels, colors=colors, pie_order=pie_order)
   return actions
 
 def make_eventplot_from_actions(actions, granularity=0.1, line_offset=0,
-    line_length=2, line_width=2):
+    line_length=2, line_width=2, cache=None, colors=colors):
   """Plots an event plot by chunking each interval.
 
   Args:
@@ -212,6 +373,9 @@ def make_eventplot_from_actions(actions, granularity=0.1, line_offset=0,
     line_offset: The vertical offset of the events.
     line_length: The vertical height of the event bars.
     line_width: The horizontal width of the events.
+    cache: Optional 'derived_cache.DerivedCache' for memoizing the chunked
+      events.
+    colors: The dictionary from keystrokes to hex colors.
 
   Returns:
     Dictionary from keystrokes to lists of event instances.
@@ -222,7 +386,11 @@ def make_eventplot_from_actions(actions, granularity=0.1, line_offset=0,
   linewidths = []
   lineoffsets = []
   linelengths = []
-  chunked_actions = {}
+  if cache is None:
+    chunked_actions = chunk_actions(actions, granularity=granularity)
+  else:
+    chunked_actions = cache.memoize('chunked', chunk_actions, actions,
+        granularity=granularity)
   for action in actions:
     color_hex = colors[action]
     red, green, blue = bytearray.fromhex(color_hex[1:])
@@ -232,10 +400,6 @@ def make_eventplot_from_actions(actions, granularity=0.1, line_offset=0,
     lineoffsets.append(0)
     linelengths.append(2)
 
-    chunked_actions[action] = []
-    for interval in actions[action]:
-      for time in np.arange(interval[0], interval[1], granularity): 
-        chunked_actions[action].append(time)
     print(chunked_actions[action])
     chunked_data.append(chunked_actions[action])
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+#
+#  Copyright 2019, Jack Poulson, Sandra Poulson
+#  All rights reserved.
+#
+#  This file is part of mice_notes and is under the BSD 3-Clause License,
+#  which can be found in the LICENSE file in the root directory, or at
+#  http://opensource.org/licenses/BSD-2-Clause
+#
+
+import json
+import time
+import numpy as np
+
+# The stages of a single pass through the recorder loop, in the order in
+# which they occur. SET_RAW switches the terminal into raw mode before the
+# key is read and READ is the (blocking) wait for the next keystroke; the
+# remaining stages make up the latency between a key being delivered and its
+# segment being appended.
+SET_RAW, READ, RESTORE, DISPATCH, PRINT, APPEND = range(6)
+stage_names = ('set_raw', 'read', 'restore', 'dispatch', 'print', 'append')
+latency_stages = (RESTORE, DISPATCH, PRINT, APPEND)
+
+# Latency histogram bin edges in microseconds.
+default_edges = (0, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+                 np.inf)
+
+
+class RecorderProfiler(object):
+  """Opt-in per-stage timings of the keypress loop of 'mice_notes.record'.
+
+  The timings of the most recent 'capacity' keystrokes are kept in a ring
+  buffer which is allocated up front, so that recording a keystroke only
+  writes into existing arrays. Stages which did not run for a keystroke
+  (e.g., PRINT without 'print_progress' or APPEND when the same key is
+  pressed again) are left as NaN so that they do not skew the statistics.
+  """
+
+  def __init__(self, capacity=4096, trace_path=None):
+    """
+    Args:
+      capacity: The number of keystrokes retained in the ring buffer.
+      trace_path: If given, a Chrome trace (JSON) is written here by 'finish'.
+    """
+    self.capacity = capacity
+    self.trace_path = trace_path
+    self._durations = np.full((capacity, len(stage_names)), np.nan)
+    self._starts = np.zeros(capacity)
+    self._count = 0
+    self._row = -1
+    self._last = 0.
+    self._origin = time.perf_counter()
+
+  def begin(self):
+    """Starts timing a new pass through the loop."""
+    self._row = self._count % self.capacity
+    self._count += 1
+    self._durations[self._row].fill(np.nan)
+    self._last = time.perf_counter()
+    self._starts[self._row] = self._last
+
+  def mark(self, stage):
+    """Attributes the time since the previous mark to the given stage."""
+    now = time.perf_counter()
+    self._durations[self._row, stage] = now - self._last
+    self._last = now
+
+  def durations(self):
+    """Returns the (num_keystrokes, num_stages) seconds, oldest first.
+
+    Stages which did not run for a keystroke are NaN.
+    """
+    if self._count <= self.capacity:
+      return self._durations[:self._count].copy()
+    return np.roll(self._durations, -(self._count % self.capacity), axis=0)
+
+  def starts(self):
+    """Returns the perf_counter start time of each keystroke, oldest first."""
+    if self._count <= self.capacity:
+      return self._starts[:self._count].copy()
+    return np.roll(self._starts, -(self._count % self.capacity))
+
+  def latencies(self):
+    """Returns the seconds from each key being read to its segment update.
+
+    Keystrokes which never reached the segment update (pause toggles and
+    keys pressed while paused) are NaN.
+    """
+    durations = self.durations()
+    latencies = np.nansum(durations[:, latency_stages], axis=1)
+    handled = (~np.isnan(durations[:, DISPATCH]) |
+               ~np.isnan(durations[:, APPEND]))
+    latencies[~handled] = np.nan
+    return latencies
+
+  def latency_histogram(self, edges=default_edges):
+    """Returns the histogram counts and the edges (in microseconds)."""
+    latencies = self.latencies()
+    latencies = latencies[~np.isnan(latencies)]
+    counts, edges = np.histogram(1e6 * latencies, bins=edges)
+    return counts, edges
+
+  def print_summary(self, edges=default_edges):
+    """Prints per-stage percentiles and the keypress latency histogram."""
+    durations = 1e6 * self.durations()
+    print('')
+    print('Recorder timings over {} keystrokes (microseconds)'.format(
+        len(durations)))
+    if not len(durations):
+      return
+    for stage, name in enumerate(stage_names):
+      if stage == READ:
+        continue
+      timings = durations[:, stage]
+      timings = timings[~np.isnan(timings)]
+      if not len(timings):
+        print('  {:<10} (never ran)'.format(name))
+        continue
+      median, tail = np.percentile(timings, [50, 99])
+      print('  {:<10} median {:10.1f}  p99 {:10.1f}  ({} samples)'.format(
+          name, median, tail, len(timings)))
+
+    counts, edges = self.latency_histogram(edges)
+    print('Keypress latency histogram, excluding set_raw (microseconds)')
+    for count, lower, upper in zip(counts, edges[:-1], edges[1:]):
+      print('  [{:>7g}, {:>7g}) {}'.format(lower, upper, count))
+
+  def chrome_trace(self):
+    """Returns the timings in the Chrome trace event format."""
+    durations = self.durations()
+    elapsed = np.nan_to_num(durations)
+    offsets = np.cumsum(elapsed, axis=1) - elapsed
+    begins = 1e6 * (self.starts()[:, None] - self._origin + offsets)
+    events = []
+    for keystroke in range(len(durations)):
+      for stage, name in enumerate(stage_names):
+        if not durations[keystroke, stage] > 0:
+          continue
+        events.append({
+          'name': name,
+          'cat': 'recorder',
+          'ph': 'X',
+          'ts': begins[keystroke, stage],
+          'dur': 1e6 * durations[keystroke, stage],
+          'pid': 0,
+          'tid': 0,
+          'args': {'keystroke': keystroke},
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+  def write_chrome_trace(self, path):
+    """Writes the timings as a Chrome trace (viewable in chrome://tracing)."""
+    with open(path, 'w') as trace_file:
+      json.dump(self.chrome_trace(), trace_file)
+
+  def finish(self):
+    """Prints the summary and, if requested, writes the Chrome trace."""
+    self.print_summary()
+    if self.trace_path is not None:
+      self.write_chrome_trace(self.trace_path)
+      print('Wrote recorder trace to {}'.format(self.trace_path))
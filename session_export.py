@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+#
+#  Copyright 2019, Jack Poulson, Sandra Poulson
+#  All rights reserved.
+#
+#  This file is part of mice_notes and is under the BSD 3-Clause License,
+#  which can be found in the LICENSE file in the root directory, or at
+#  http://opensource.org/licenses/BSD-2-Clause
+#
+
+"""
+Export of recorded sessions to a single long-format table with the columns
+(animal, condition, behavior, start, end).
+
+Sessions are consumed lazily as (animal, condition, actions) triples and the
+rows are written in chunks of a fixed size, so that memory use does not grow
+with the size of the archive.
+"""
+
+import csv
+import itertools
+import json
+import os
+import numpy as np
+
+columns = ('animal', 'condition', 'behavior', 'start', 'end')
+categorical_columns = ('animal', 'condition', 'behavior')
+numeric_columns = ('start', 'end')
+
+# The on-disk types of the columns of the columnar format. Categorical
+# columns hold indices into the category lists of the manifest.
+code_dtype = np.dtype('<i4')
+time_dtype = np.dtype('<f8')
+
+manifest_name = 'manifest.json'
+
+
+def iter_rows(sessions, labels=None):
+  """Yields one (animal, condition, behavior, start, end) row per interval.
+
+  Args:
+    sessions: An iterable of (animal, condition, actions) triples, where
+      actions is the dictionary from keystrokes to event interval lists.
+    labels: Optional dictionary from keystrokes to the behavior names to
+      export; keystrokes missing from it (and all keystrokes, by default) are
+      exported as is.
+  """
+  for animal, condition, actions in sessions:
+    for key in sorted(actions):
+      behavior = key if labels is None else labels.get(key, key)
+      for start, end in actions[key]:
+        yield animal, condition, behavior, start, end
+
+
+def iter_chunks(rows, chunk_size):
+  """Yields consecutive lists of at most 'chunk_size' rows."""
+  rows = iter(rows)
+  while True:
+    chunk = list(itertools.islice(rows, chunk_size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def write_csv(sessions, path, chunk_size=65536, labels=None):
+  """Streams sessions into a long-format CSV file.
+
+  Args:
+    sessions: An iterable of (animal, condition, actions) triples.
+    path: The path of the CSV file to write.
+    chunk_size: The number of rows to buffer between writes.
+    labels: Optional dictionary from keystrokes to behavior names.
+
+  Returns:
+    The number of rows written.
+  """
+  num_rows = 0
+  with open(path, 'w', newline='') as csv_file:
+    writer = csv.writer(csv_file)
+    writer.writerow(columns)
+    for chunk in iter_chunks(iter_rows(sessions, labels), chunk_size):
+      writer.writerows(chunk)
+      num_rows += len(chunk)
+  return num_rows
+
+
+def write_columnar(sessions, directory, chunk_size=65536, labels=None):
+  """Streams sessions into a directory of memory-mappable column files.
+
+  Each column is stored as a raw little-endian array ('<column>.bin'). The
+  animal, condition and behavior columns are dictionary encoded as int32
+  indices into the category lists stored in 'manifest.json', which also
+  records the number of rows and the dtype of each column.
+
+  Args:
+    sessions: An iterable of (animal, condition, actions) triples.
+    directory: The directory to write the columns into.
+    chunk_size: The number of rows to buffer between writes.
+    labels: Optional dictionary from keystrokes to behavior names.
+
+  Returns:
+    The number of rows written.
+  """
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+
+  # The manifest is written last, so remove any previous one up front to
+  # avoid it describing partially overwritten columns if the export fails.
+  manifest_path = os.path.join(directory, manifest_name)
+  if os.path.exists(manifest_path):
+    os.remove(manifest_path)
+
+  categories = dict((name, {}) for name in categorical_columns)
+  files = dict((name, open(os.path.join(directory, name + '.bin'), 'wb'))
+               for name in columns)
+  num_rows = 0
+  try:
+    for chunk in iter_chunks(iter_rows(sessions, labels), chunk_size):
+      fields = list(zip(*chunk))
+      for index, name in enumerate(columns):
+        if name in categories:
+          codes = categories[name]
+          values = [codes.setdefault(str(value), len(codes))
+                    for value in fields[index]]
+          np.asarray(values, dtype=code_dtype).tofile(files[name])
+        else:
+          np.asarray(fields[index], dtype=time_dtype).tofile(files[name])
+      num_rows += len(chunk)
+  finally:
+    for column_file in files.values():
+      column_file.close()
+
+  manifest = {'num_rows': num_rows, 'columns': {}}
+  for name in columns:
+    entry = {'file': name + '.bin'}
+    if name in categories:
+      codes = categories[name]
+      entry['dtype'] = code_dtype.str
+      entry['categories'] = sorted(codes, key=codes.get)
+    else:
+      entry['dtype'] = time_dtype.str
+    manifest['columns'][name] = entry
+  with open(manifest_path, 'w') as manifest_file:
+    json.dump(manifest, manifest_file, indent=2)
+
+  return num_rows
+
+
+def read_columnar(directory):
+  """Memory-maps a directory written by 'write_columnar'.
+
+  Args:
+    directory: The directory containing the columns and manifest.
+
+  Returns:
+    Pair of a dictionary from column names to read-only arrays (integer codes
+    for the categorical columns) and a dictionary from the categorical column
+    names to their lists of categories.
+  """
+  with open(os.path.join(directory, manifest_name)) as manifest_file:
+    manifest = json.load(manifest_file)
+
+  num_rows = manifest['num_rows']
+  arrays = {}
+  categories = {}
+  for name, entry in manifest['columns'].items():
+    dtype = np.dtype(entry['dtype'])
+    if num_rows:
+      arrays[name] = np.memmap(os.path.join(directory, entry['file']),
+          dtype=dtype, mode='r', shape=(num_rows,))
+    else:
+      arrays[name] = np.zeros(0, dtype=dtype)
+    if 'categories' in entry:
+      categories[name] = entry['categories']
+  return arrays, categories
+
+
+def read_dataframe(directory):
+  """Loads a directory written by 'write_columnar' as a pandas DataFrame.
+
+  The categorical columns become pandas Categoricals built directly from the
+  memory-mapped codes.
+  """
+  import pandas as pd
+  arrays, categories = read_columnar(directory)
+  data = {}
+  for name in columns:
+    if name in categories:
+      data[name] = pd.Categorical.from_codes(arrays[name],
+                                             categories=categories[name])
+    else:
+      data[name] = arrays[name]
+  return pd.DataFrame(data, columns=list(columns))
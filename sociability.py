@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+#
+#  Copyright 2019, Jack Poulson, Sandra Poulson
+#  All rights reserved.
+#
+#  This file is part of mice_notes and is under the BSD 3-Clause License,
+#  which can be found in the LICENSE file in the root directory, or at
+#  http://opensource.org/licenses/BSD-2-Clause
+#
+
+"""
+Analysis of two/three chamber sociability sessions recorded by twochamber.
+
+Every routine accepts either a single actions dictionary or a list of them
+(one per trial) and operates on all trials at once through a flat interval
+store, so that batch runs over many trials do not loop in Python over the
+individual segments.
+"""
+
+import numpy as np
+import mice_notes
+
+# The chamber keystrokes of twochamber, in the order of the output columns.
+chambers = ('r', 'c', 'l')
+
+
+def _as_trials(trials):
+  if isinstance(trials, dict):
+    return [trials]
+  return list(trials)
+
+
+def interval_store(trials, chambers=chambers):
+  """Flattens the chamber intervals of a batch of trials into arrays.
+
+  In twochamber, the 'o' state only results from an unrecognized keystroke,
+  so the animal is treated as having stayed put: consecutive intervals in the
+  same chamber (once the other states are dropped) are merged into a single
+  visit spanning from the start of the first to the end of the last.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    chambers: The keystrokes to keep; other states (e.g., 'o') are dropped.
+
+  Returns:
+    Dictionary of equal-length arrays 'trial', 'chamber' (index into
+    'chambers'), 'start' and 'end' of each visit, sorted by trial and then by
+    start time, along with the boolean array 'entry' marking visits which
+    began after the start of their trial.
+  """
+  trial_list, chamber_list, start_list, end_list = [], [], [], []
+  for trial_index, actions in enumerate(_as_trials(trials)):
+    for chamber_index, key in enumerate(chambers):
+      segments = actions.get(key, [])
+      if not len(segments):
+        continue
+      segments = np.asarray(segments, dtype=float).reshape(-1, 2)
+      trial_list.append(np.full(len(segments), trial_index, dtype=np.intp))
+      chamber_list.append(np.full(len(segments), chamber_index, dtype=np.intp))
+      start_list.append(segments[:, 0])
+      end_list.append(segments[:, 1])
+
+  if not trial_list:
+    empty_int = np.zeros(0, dtype=np.intp)
+    empty_float = np.zeros(0)
+    return {'trial': empty_int, 'chamber': empty_int, 'start': empty_float,
+            'end': empty_float, 'entry': np.zeros(0, dtype=bool)}
+
+  trial = np.concatenate(trial_list)
+  chamber = np.concatenate(chamber_list)
+  start = np.concatenate(start_list)
+  end = np.concatenate(end_list)
+  order = np.lexsort((start, trial))
+  trial, chamber, start, end = \
+      trial[order], chamber[order], start[order], end[order]
+
+  # A visit begins with the first interval of a trial or a change of chamber.
+  first = np.ones(len(trial), dtype=bool)
+  first[1:] = trial[1:] != trial[:-1]
+  visit = first.copy()
+  visit[1:] |= chamber[1:] != chamber[:-1]
+  visit_starts = np.flatnonzero(visit)
+
+  # The first visit of each trial is the starting chamber, not an entry.
+  return {'trial': trial[visit], 'chamber': chamber[visit],
+          'start': start[visit],
+          'end': np.maximum.reduceat(end, visit_starts),
+          'entry': ~first[visit]}
+
+
+def chamber_entries(trials, chambers=chambers):
+  """Counts the number of entries into each chamber.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    chambers: The chamber keystrokes.
+
+  Returns:
+    Integer array of shape (num_trials, num_chambers).
+  """
+  num_trials = len(_as_trials(trials))
+  store = interval_store(trials, chambers)
+  counts = np.zeros((num_trials, len(chambers)), dtype=np.intp)
+  np.add.at(counts, (store['trial'][store['entry']],
+                     store['chamber'][store['entry']]), 1)
+  return counts
+
+
+def first_entry_latency(trials, chambers=chambers):
+  """Returns the time of the first entry into each chamber.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    chambers: The chamber keystrokes.
+
+  Returns:
+    Array of shape (num_trials, num_chambers) holding NaN for chambers which
+    were never entered.
+  """
+  num_trials = len(_as_trials(trials))
+  store = interval_store(trials, chambers)
+  latency = np.full((num_trials, len(chambers)), np.inf)
+  np.minimum.at(latency, (store['trial'][store['entry']],
+                          store['chamber'][store['entry']]),
+                store['start'][store['entry']])
+  latency[np.isinf(latency)] = np.nan
+  return latency
+
+
+def dwell_times(trials, chambers=chambers):
+  """Returns the individual dwell times of the visits to each chamber.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    chambers: The chamber keystrokes.
+
+  Returns:
+    Dictionary from chamber keystrokes to pairs of arrays (trial indices,
+    dwell times in seconds).
+  """
+  store = interval_store(trials, chambers)
+  durations = store['end'] - store['start']
+  result = {}
+  for chamber_index, key in enumerate(chambers):
+    mask = store['chamber'] == chamber_index
+    result[key] = (store['trial'][mask], durations[mask])
+  return result
+
+
+def dwell_time_histograms(trials, bins, chambers=chambers):
+  """Histograms the dwell times in each chamber of each trial.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    bins: The monotonically increasing dwell time bin edges in seconds.
+    chambers: The chamber keystrokes.
+
+  Returns:
+    Integer array of shape (num_trials, num_chambers, len(bins) - 1). As with
+    numpy.histogram, the last bin includes its right edge.
+  """
+  bins = np.asarray(bins, dtype=float)
+  num_trials = len(_as_trials(trials))
+  store = interval_store(trials, chambers)
+  durations = store['end'] - store['start']
+
+  bin_index = np.searchsorted(bins, durations, side='right') - 1
+  bin_index[durations == bins[-1]] = len(bins) - 2
+  valid = (bin_index >= 0) & (bin_index < len(bins) - 1)
+
+  counts = np.zeros((num_trials, len(chambers), len(bins) - 1), dtype=np.intp)
+  np.add.at(counts, (store['trial'][valid], store['chamber'][valid],
+                     bin_index[valid]), 1)
+  return counts
+
+
+def chamber_occupancy(trials, bin_width=60., duration=None, chambers=chambers):
+  """Computes the time spent in each chamber within consecutive time bins.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    bin_width: The width of each time bin in seconds.
+    duration: The length of the sessions; defaults to the last interval end.
+    chambers: The chamber keystrokes.
+
+  Returns:
+    Pair of the bin edges and an array of shape
+    (num_trials, num_chambers, num_bins) of seconds spent in each chamber.
+  """
+  num_trials = len(_as_trials(trials))
+  store = interval_store(trials, chambers)
+  if duration is None:
+    duration = store['end'].max() if len(store['end']) else 0.
+  num_bins = max(int(np.ceil(duration / bin_width)), 1)
+  edges = bin_width * np.arange(num_bins + 1, dtype=float)
+
+  groups = store['trial'] * len(chambers) + store['chamber']
+  occupancy = mice_notes.bin_intervals(store['start'], store['end'], groups,
+      num_trials * len(chambers), edges)
+  return edges, occupancy.reshape(num_trials, len(chambers), num_bins)
+
+
+def preference_index(trials, social, nonsocial, bin_width=60., duration=None,
+    chambers=chambers):
+  """Computes the sociability/preference index within each time bin.
+
+  The index is (S - N) / (S + N), where S and N are the times spent in the
+  social and non-social chambers, respectively. It ranges from -1 (only the
+  non-social chamber) to 1 (only the social chamber) and is NaN for bins in
+  which neither chamber was visited.
+
+  Args:
+    trials: An actions dictionary or a list of them.
+    social: The keystroke of the chamber containing the stranger animal.
+    nonsocial: The keystroke of the opposing (empty or object) chamber.
+    bin_width: The width of each time bin in seconds.
+    duration: The length of the sessions; defaults to the last interval end.
+    chambers: The chamber keystrokes.
+
+  Returns:
+    Pair of the bin edges and an array of shape (num_trials, num_bins).
+  """
+  edges, occupancy = chamber_occupancy(trials, bin_width=bin_width,
+      duration=duration, chambers=chambers)
+  social_time = occupancy[:, chambers.index(social), :]
+  nonsocial_time = occupancy[:, chambers.index(nonsocial), :]
+  total = social_time + nonsocial_time
+  index = np.full(total.shape, np.nan)
+  np.divide(social_time - nonsocial_time, total, out=index, where=total > 0)
+  return edges, index
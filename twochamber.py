@@ -8,159 +8,46 @@
 #  http://opensource.org/licenses/BSD-2-Clause
 #
 
-import termios, fcntl, sys, os
+from collections import defaultdict
+import mice_notes
 
-# The routines ready_stdin, read_key, and restore_stdin are a reformulation
-# of the following Stack Overflow answer:
-#     http://stackoverflow.com/a/6599441 
+labels = defaultdict()
+labels['r'] = 'Left Chamber'
+labels['c'] = 'Center'
+labels['l'] = 'Right Chamber'
+labels['o'] = 'Other'
 
-def ready_stdin():
-  fd = sys.stdin.fileno()
-  flags_save = fcntl.fcntl(fd, fcntl.F_GETFL)
-  attrs_save = termios.tcgetattr(fd)
-  attrs = list(attrs_save)
-  attrs[0] &= ~(termios.IGNBRK | \
-                termios.BRKINT | \
-                termios.PARMRK | \
-                termios.ISTRIP | \
-                termios.INLCR  | \
-                termios.IGNCR  | \
-                termios.ICRNL  | \
-                termios.IXON)
-  attrs[1] &= ~termios.OPOST
-  attrs[2] &= ~(termios.CSIZE | \
-                termios.PARENB)
-  attrs[2] |= termios.CS8
-  attrs[3] &= ~(termios.ECHONL | \
-                termios.ECHO   | \
-                termios.ICANON | \
-                termios.ISIG   | \
-                termios.IEXTEN)
-  fcntl.fcntl(fd, fcntl.F_SETFL, flags_save & ~os.O_NONBLOCK)
-  return fd, attrs, attrs_save, flags_save
+colors = defaultdict()
+colors['r'] = "#00CC44"
+colors['c'] = "#FF8000"
+colors['l'] = "#00B3B3"
+colors['o'] = "#A6A6A6"
 
-def read_key(fd,attrs,attrs_save,flags_save):
-  # TODO: Figure out how to avoid setting and resetting tc on each read
-  termios.tcsetattr(fd, termios.TCSANOW, attrs)
-  try:
-    ret = sys.stdin.read(1)
-  except KeyboardInterrupt:
-    ret = 0
-  termios.tcsetattr(fd, termios.TCSAFLUSH, attrs_save)
-  return ret
+pie_order = ('r','c','l','o')
 
-def restore_stdin(fd,attrs,attrs_save,flags_save):
-  termios.tcsetattr(fd, termios.TCSAFLUSH, attrs_save)
-  fcntl.fcntl(fd, fcntl.F_SETFL, flags_save)
-
-def start(print_progress = True):
+def start(print_progress = True, profiler = None):
   """
   This is for recording a small number of events for two animals in a two or three chamber apparatus via
   the following keypresses:
-  
+
   'r': Left Chamber (animal has all four paws in the left chamber)
-  
-  'c': Center Chamber or hallway (animal is transitioning or is in the center or hallway chamber)
-  
-  'l': Right Chamber (animal has all four paws in the right chamber)
-  
-  Additionally, 'q' quits and 'p' pauses/unpauses the recording process.
-  """
-  import time
-  from collections import defaultdict
-  time_delta = time.time()
-  paused = False
 
-  labels = defaultdict()
-  labels['r'] = 'Left Chamber'
-  labels['c'] = 'Center'
-  labels['l'] = 'Right Chamber'  
-  labels['o'] = 'Other'
+  'c': Center Chamber or hallway (animal is transitioning or is in the center or hallway chamber)
 
-  colors = defaultdict()
-  colors['r'] = "#00CC44"
-  colors['c'] = "#FF8000"
-  colors['l'] = "#00B3B3"
-  colors['o'] = "#A6A6A6"
+  'l': Right Chamber (animal has all four paws in the right chamber)
 
-  pie_order = ('r','c','l','o')
+  Additionally, 'q' quits and 'p' pauses/unpauses the recording process.
 
+  The recording uses the same engine and returns the same dictionary from
+  keystrokes to event interval lists as 'mice_notes.start', so the result can
+  be passed to 'mice_notes.make_eventplot_from_actions' (along with
+  'colors=twochamber.colors') or directly to the 'sociability' routines.
+  """
   # Initialize in the 'center' chamber
-  action_start = 0
-  action_type = 'c'
-
-  # Ready stdin for reading a single key
-  stdin_state = ready_stdin()
-
-  actions = defaultdict(list)
-  while True:
-    key = read_key(*stdin_state)
-    curr_time = time.time() - time_delta
-
-    if key == 'q':
-      # Finish the current action
-      actions[action_type].append((action_start, curr_time))
-
-      # Summarize all of the actions
-      totals = ()
-      used_labels = ()
-      used_colors = ()
-      for key in pie_order:
-        if key in actions:
-          segments = actions[key]
-
-          total = 0
-          for beg, end in segments:
-            total = total + (end - beg)
-          totals = totals + (total,)
-
-          print ''
-          print '%s (%f seconds)' % (labels[key], total)
-          print segments
-
-          used_labels = used_labels + (labels[key],)
-          used_colors = used_colors + (colors[key],)
-
-      # Attempt to create a pie chart using pyplot
-      try:
-        import matplotlib.pyplot as plt
-        plt.pie(totals, labels=used_labels, colors=used_colors, \
-          autopct='%1.1f%%', shadow=True)
-        plt.axis('equal')
-        plt.show()
-      except:
-        print 'WARNING: Could not import pyplot'
-
-      # Exit the while loop
-      break
-
-    elif key == ' ':
-      if paused:
-        pause_time = curr_time - pause_start
-        time_delta = time_delta + pause_time
-        paused = False
-        print "Ended %f second pause" % pause_time
-      else:
-        pause_start = curr_time
-        paused = True
-        print "Pausing"
-
-    elif not paused:
-      if key not in labels:
-        print "WARNING: Unrecognized key, '%s'; defaulting to 'Other'" % key
-        key = 'o'
-
-      if print_progress:
-        print '%s at %f seconds' % (labels[key], curr_time)
-
-      if action_type != key:
-        actions[action_type].append((action_start, curr_time))
-        action_type = key
-        action_start = curr_time
-
-  # Put stdin back to normal before exiting
-  restore_stdin(*stdin_state)
-
+  actions = mice_notes.record(labels, initial_key='c', default_key='o',
+      print_progress=print_progress, profiler=profiler)
+  mice_notes.report(actions, labels=labels, colors=colors,
+      pie_order=pie_order)
   return actions
 
 if __name__ == "__main__":